@@ -7,11 +7,27 @@ class Settings(BaseSettings):
     supabase_url: str = ""
     supabase_key: str = ""
     supabase_db_password: str = ""
+    # Optional direct Postgres connection string; the ingestion pipeline then
+    # upserts over asyncpg instead of the REST API
+    postgres_dsn: str = ""
+    # Drop the HNSW index before a pipeline upsert and rebuild it afterwards
+    # (large backfills only; needs postgres_dsn)
+    rebuild_index_on_ingest: bool = False
+    # maintenance_work_mem for that rebuild; keep it well below instance RAM
+    index_build_maintenance_work_mem: str = "256MB"
+    # Re-embed chunks whose doc_id is already indexed (after changing the
+    # embedding model; chunking changes are caught by CHUNK_SCHEME); by
+    # default the pipeline skips them
+    reindex_existing: bool = False
 
     # Table / function names
     documents_table: str = "documents"
     feedback_table: str = "feedback"
     match_function: str = "match_documents"
+    # Optional: sql/match_documents_ranked.sql — re-ranks in the database
+    ranked_match_function: str = ""
+    # URLs whose UCB1 bonus is sent to the ranked match function per query
+    ranked_match_bonus_limit: int = 1000
 
     # Google Gemini — set via .env
     gemini_api_key: str = ""
@@ -20,12 +36,19 @@ class Settings(BaseSettings):
 
     # Embeddings
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    # "torch" (default) or "onnx" — ONNX Runtime with an int8-quantized export
+    embedding_backend: str = "torch"
+    embedding_onnx_file: str = "onnx/model_qint8_avx512_vnni.onnx"
+    # "cpu" or "cuda"; on CUDA the torch backend runs in float16
+    embedding_device: str = "cpu"
 
     # Data pipeline — set EVENT_REGISTRY_API_KEY via .env
     articles_json_path: str = "genai_competitors_articles.json"
     event_registry_api_key: str = ""
     news_lookback_days: int = 30
     news_max_items_per_company: int = 50
+    # Companies queried at once; keeps bursts within EventRegistry rate limits
+    news_fetch_concurrency: int = 4
 
     # Frontend CORS origin
     frontend_origin: str = "http://localhost:8501"
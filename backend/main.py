@@ -3,24 +3,18 @@ import os
 os.environ.setdefault("USE_TF", "0")
 os.environ.setdefault("USE_TORCH", "1")
 
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from backend.config import get_settings
 from backend.routers import health, ask, feedback
-from backend.services.embeddings import get_embeddings
-from backend.services.feedback_rl import get_supabase_client
+from backend.services.embeddings import get_embeddings, get_query_batcher
+from backend.services.feedback_rl import get_bandit, get_supabase_client
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """
-    Startup: warm up the embedding model and verify Supabase connectivity
-    so the first request is not slow. Services that fail are logged as
-    warnings — the server still starts so requests can surface the real error.
-    Shutdown: nothing to clean up.
-    """
+def _warm_embeddings() -> None:
     print("[startup] Loading embedding model...")
     try:
         get_embeddings()
@@ -28,6 +22,8 @@ async def lifespan(app: FastAPI):
     except Exception as exc:
         print(f"[startup] WARNING: Embedding model failed: {exc}")
 
+
+def _check_supabase() -> None:
     print("[startup] Connecting to Supabase...")
     try:
         get_supabase_client().table("documents").select("id").limit(1).execute()
@@ -35,8 +31,43 @@ async def lifespan(app: FastAPI):
     except Exception as exc:
         print(f"[startup] WARNING: Supabase not reachable at startup: {exc}")
 
-    print("[startup] Ready.")
+
+def _load_bandit() -> None:
+    print("[startup] Loading feedback bandit...")
+    try:
+        get_bandit()
+        print("[startup] Feedback bandit loaded.")
+    except Exception as exc:
+        print(f"[startup] WARNING: Feedback bandit failed: {exc}")
+
+
+async def _warm_up() -> None:
+    await asyncio.gather(
+        asyncio.to_thread(_warm_embeddings),
+        asyncio.to_thread(_check_supabase),
+        asyncio.to_thread(_load_bandit),
+    )
+    print("[startup] Warm-up complete.")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup: warm up the embedding model, verify Supabase connectivity and
+    load the feedback bandit so the first request is not slow. The three are
+    independent, so they run concurrently in worker threads, and in the
+    background: the port binds (and /health answers) immediately instead of
+    waiting for the model to load. Requests that arrive early simply wait
+    for the shared singletons. Services that fail are logged as warnings —
+    the server still starts so requests can surface the real error.
+    Shutdown: stop waiting on an unfinished warm-up and stop the query
+    batcher's worker task.
+    """
+    warm_up = asyncio.create_task(_warm_up())
+    print("[startup] Ready (warm-up running in background).")
     yield
+    warm_up.cancel()
+    await get_query_batcher().aclose()
 
 
 settings = get_settings()
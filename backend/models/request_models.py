@@ -1,10 +1,11 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 
 
 class QueryRequest(BaseModel):
     query: str
     top_k: int = Field(default=5, ge=1, le=20)
+    company: Optional[str] = None
 
 
 class QueryResponse(BaseModel):
@@ -8,7 +8,7 @@ router = APIRouter()
 @router.post("/ask", response_model=QueryResponse)
 async def ask(req: QueryRequest):
     """Answer a business intelligence query using RAG + feedback re-ranking."""
-    result = run_rag_pipeline(req.query, req.top_k)
+    result = await run_rag_pipeline(req.query, req.top_k, req.company)
     return QueryResponse(
         query=req.query,
         answer=result["answer"],
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import APIRouter
 from backend.models.feedback_models import FeedbackRequest, FeedbackResponse
 from backend.services.feedback_rl import store_feedback
@@ -11,7 +12,8 @@ async def feedback(req: FeedbackRequest):
     Store thumbs-up / thumbs-down feedback for an answer.
     Invalid feedback types are rejected with HTTP 422 (Pydantic validation).
     """
-    feedback_id = store_feedback(
+    feedback_id = await asyncio.to_thread(
+        store_feedback,
         query=req.query,
         answer=req.answer,
         sources=req.sources,
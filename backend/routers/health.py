@@ -1,21 +1,25 @@
+import asyncio
 from fastapi import APIRouter
+from backend.models.health_models import HealthResponse
 from backend.services.feedback_rl import get_supabase_client
 
 router = APIRouter()
 
 
-@router.get("/health")
+@router.get("/health", response_model=HealthResponse)
 async def health():
     """Liveness + dependency check endpoint."""
     try:
         client = get_supabase_client()
         # A lightweight query — just fetch 1 row to confirm DB connectivity
-        client.table("documents").select("id").limit(1).execute()
+        await asyncio.to_thread(
+            client.table("documents").select("id").limit(1).execute
+        )
         db_status = "ok"
     except Exception as exc:
         db_status = f"error: {exc}"
 
-    return {
-        "status": "ok" if db_status == "ok" else "degraded",
-        "supabase": db_status,
-    }
+    return HealthResponse(
+        status="ok" if db_status == "ok" else "degraded",
+        supabase=db_status,
+    )
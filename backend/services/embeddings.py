@@ -1,14 +1,213 @@
+import asyncio
+import threading
+from collections import OrderedDict
 from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Sequence
+
+import numpy as np
+import orjson
 from langchain_huggingface import HuggingFaceEmbeddings
 from backend.config import get_settings
 
+if TYPE_CHECKING:
+    from transformers import PreTrainedTokenizerBase
+
+
+# The startup warm-up and an early request may both ask for the model
+_embeddings_lock = threading.Lock()
+# Whether the loaded model's tokenizer folds case; set once the model loads
+_uncased_model = False
+
 
-@lru_cache()
 def get_embeddings() -> HuggingFaceEmbeddings:
-    """Cached HuggingFace embedding model (all-MiniLM-L6-v2, 384 dims)."""
+    """
+    Cached HuggingFace embedding model (all-MiniLM-L6-v2, 384 dims).
+
+    With EMBEDDING_BACKEND=onnx the model runs on ONNX Runtime using the
+    dynamically int8-quantized export from the model repo, which is several
+    times faster on CPU than the FP32 PyTorch forward pass. With
+    EMBEDDING_DEVICE=cuda the PyTorch model is loaded in float16 (encode()
+    already runs under torch.inference_mode()). Concurrent first calls
+    share one load instead of each loading the weights.
+    """
+    with _embeddings_lock:
+        return _load_embeddings()
+
+
+@lru_cache()
+def _load_embeddings() -> HuggingFaceEmbeddings:
     settings = get_settings()
-    return HuggingFaceEmbeddings(
+    model_kwargs = {"device": settings.embedding_device}
+    if settings.embedding_backend == "onnx":
+        model_kwargs["backend"] = "onnx"
+        model_kwargs["model_kwargs"] = {"file_name": settings.embedding_onnx_file}
+    elif settings.embedding_device.startswith("cuda"):
+        # Half precision doubles GPU throughput; normalised MiniLM vectors
+        # are unaffected at the precision pgvector compares them
+        import torch
+
+        model_kwargs["model_kwargs"] = {"torch_dtype": torch.float16}
+
+    embeddings = HuggingFaceEmbeddings(
         model_name=settings.embedding_model,
-        model_kwargs={"device": "cpu"},
-        encode_kwargs={"normalize_embeddings": True},
+        model_kwargs=model_kwargs,
+        encode_kwargs={"normalize_embeddings": True, "batch_size": 64},
     )
+    global _uncased_model
+    _uncased_model = bool(getattr(embeddings._client.tokenizer, "do_lower_case", False))
+    return embeddings
+
+
+@lru_cache()
+def get_tokenizer() -> "PreTrainedTokenizerBase":
+    """
+    Cached fast tokenizer of the embedding model, used to size chunks in
+    model tokens. Loading it does not load the model weights.
+    """
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(get_settings().embedding_model)
+
+
+def _normalize_query(query: str) -> str:
+    # Tokenizers ignore extra whitespace, and uncased ones (MiniLM's) also
+    # ignore case, so these variants embed identically and can share a cache
+    # entry. Case is kept for cased models, and until the model has loaded:
+    # deciding must not load anything on the request path.
+    query = " ".join(query.split())
+    if _uncased_model:
+        query = query.lower()
+    return query
+
+
+def to_pgvector(embedding: Sequence[float], decimals: Optional[int] = None) -> str:
+    """
+    Serialise an embedding as a pgvector literal ('[x,y,...]').
+
+    Formatting the float32 values directly keeps the text ~40% shorter than
+    JSON-encoding a list of Python floats, and PostgREST casts the string
+    straight to vector. `decimals` rounds the values first, for embeddings
+    already reduced to float16 precision where further digits are noise.
+    """
+    values = np.asarray(embedding, dtype=np.float32)
+    if decimals is not None:
+        values = values.round(decimals)
+    return orjson.dumps(values, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+class _QueryCache:
+    """Thread-safe LRU map of normalised query -> pgvector literal."""
+
+    def __init__(self, maxsize: int = 4096):
+        self._data: "OrderedDict[str, str]" = OrderedDict()
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+
+_query_cache = _QueryCache()
+
+
+class QueryBatcher:
+    """
+    Coalesces concurrent query embeddings into a single batched encode.
+
+    Callers that arrive within `max_wait` seconds of each other are embedded
+    together (up to `max_batch` texts) in one worker thread, so concurrent
+    /ask requests share a transformer forward pass instead of each paying
+    for their own.
+    """
+
+    def __init__(self, max_batch: int = 32, max_wait: float = 0.005):
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def embed(self, text: str) -> List[float]:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def aclose(self) -> None:
+        """Cancel the worker task; call on shutdown, from the serving loop."""
+        worker, self._worker = self._worker, None
+        if worker is None or worker.done():
+            return
+        worker.cancel()
+        try:
+            await worker
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._max_wait
+            while len(batch) < self._max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await asyncio.to_thread(get_embeddings().embed_documents, texts)
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+
+@lru_cache()
+def get_query_batcher() -> QueryBatcher:
+    """Cached process-wide QueryBatcher."""
+    return QueryBatcher()
+
+
+def embed_query(query: str) -> str:
+    """
+    Embed a query string as a pgvector literal, skipping the model for
+    repeated queries.
+    """
+    key = _normalize_query(query)
+    cached = _query_cache.get(key)
+    if cached is None:
+        cached = to_pgvector(get_embeddings().embed_query(key))
+        _query_cache.put(key, cached)
+    return cached
+
+
+async def aembed_query(query: str) -> str:
+    """Async embed_query: cache misses go through the shared QueryBatcher."""
+    key = _normalize_query(query)
+    cached = _query_cache.get(key)
+    if cached is None:
+        cached = to_pgvector(await get_query_batcher().embed(key))
+        _query_cache.put(key, cached)
+    return cached
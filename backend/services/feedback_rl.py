@@ -1,29 +1,43 @@
+import threading
 from functools import lru_cache
 from typing import Dict, List
 import uuid
 
+import numpy as np
+
 from supabase import create_client, Client
 from backend.config import get_settings
 from rl.bandit import UCB1Bandit
 
+settings = get_settings()
+
+# store_feedback runs in worker threads, so bandit access is serialised
+_bandit_lock = threading.Lock()
+# The startup warm-up and an early request may both ask for the bandit
+_bandit_load_lock = threading.Lock()
+
 
 @lru_cache()
 def get_supabase_client() -> Client:
     """Cached Supabase client (service-role key, bypasses RLS)."""
-    settings = get_settings()
     return create_client(settings.supabase_url, settings.supabase_key)
 
 
 @lru_cache()
+def _load_bandit() -> UCB1Bandit:
+    bandit = UCB1Bandit()
+    bandit.load_from_supabase(get_supabase_client(), settings.feedback_table)
+    return bandit
+
+
 def get_bandit() -> UCB1Bandit:
     """
     Cached UCB1Bandit instance, pre-loaded with all historical
     feedback from Supabase so scores survive server restarts.
+    Concurrent first calls share one load instead of building two bandits.
     """
-    settings = get_settings()
-    bandit = UCB1Bandit()
-    bandit.load_from_supabase(get_supabase_client(), settings.feedback_table)
-    return bandit
+    with _bandit_load_lock:
+        return _load_bandit()
 
 
 def ensure_feedback_table_exists() -> None:
@@ -45,7 +59,6 @@ def store_feedback(
     Persist a feedback event to Supabase and update the UCB1 bandit.
     Returns the generated feedback_id (UUID).
     """
-    settings = get_settings()
     client = get_supabase_client()
     bandit = get_bandit()
 
@@ -53,8 +66,9 @@ def store_feedback(
     reward = 1.0 if feedback == "positive" else 0.0
 
     # Update in-memory bandit immediately
-    for url in sources:
-        bandit.update(url, reward)
+    with _bandit_lock:
+        for url in sources:
+            bandit.update(url, reward)
 
     client.table(settings.feedback_table).insert(
         {
@@ -71,5 +85,23 @@ def store_feedback(
 
 def get_feedback_scores(urls: List[str]) -> Dict[str, float]:
     """Return a UCB1 score for each URL (used for re-ranking)."""
+    return dict(zip(urls, get_feedback_score_array(urls).tolist()))
+
+
+def get_feedback_score_array(urls: List[str]) -> np.ndarray:
+    """UCB1 scores for `urls` as an array aligned with the input order."""
+    bandit = get_bandit()
+    with _bandit_lock:
+        return bandit.score_many(urls)
+
+
+def get_feedback_bonus() -> Dict[str, float]:
+    """
+    Return the UCB1 scores of the RANKED_MATCH_BONUS_LIMIT highest-scoring
+    URLs (for server-side re-ranking). The map travels as the RPC's JSONB
+    argument on every query, so it is capped rather than growing with the
+    feedback history; URLs left out get no bonus.
+    """
     bandit = get_bandit()
-    return {url: bandit.get_score(url) for url in urls}
+    with _bandit_lock:
+        return bandit.get_scores(limit=settings.ranked_match_bonus_limit)
@@ -1,16 +1,26 @@
+import asyncio
 from functools import lru_cache
-from typing import List, Dict, Any
+from typing import List, Dict, Any, NamedTuple, Optional
 
+import numpy as np
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable
 from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import Field
 
 from backend.config import get_settings
-from backend.services.embeddings import get_embeddings
-from backend.services.feedback_rl import get_supabase_client, get_feedback_scores
+from backend.services.embeddings import aembed_query, embed_query
+from backend.services.feedback_rl import (
+    get_bandit,
+    get_feedback_bonus,
+    get_feedback_score_array,
+    get_supabase_client,
+)
+
+settings = get_settings()
 
 
 BI_ASSISTANT_PROMPT = ChatPromptTemplate.from_messages(
@@ -31,6 +41,19 @@ Context:
 )
 
 
+class _Candidate(NamedTuple):
+    """A retrieved chunk awaiting re-ranking."""
+
+    doc: Document
+    url: str
+    vector_score: float
+
+
+# Only the columns the retriever reads. match_documents variants often also
+# return the stored embedding, which is ~8 KB of JSON per row we never use.
+_MATCH_COLUMNS = ("content", "metadata", "similarity")
+
+
 class FeedbackAwareRetriever(BaseRetriever):
     """
     Retriever that calls the match_documents Supabase RPC directly,
@@ -39,59 +62,113 @@ class FeedbackAwareRetriever(BaseRetriever):
     """
 
     top_k: int = Field(default=5)
-
-    def _get_relevant_documents(self, query: str) -> List[Document]:
-        settings = get_settings()
-        client = get_supabase_client()
-        emb_model = get_embeddings()
-
-        # 1. Embed the query
-        query_embedding = emb_model.embed_query(query)
-
-        # 2. Fetch 2x candidates via match_documents RPC
-        response = client.rpc(
+    company: Optional[str] = Field(default=None)
+
+    def _filter(self) -> Dict[str, Any]:
+        """metadata @> filter for the match RPCs; narrows the search to one company."""
+        return {"company": self.company} if self.company else {}
+
+    def _match_documents(self, query_embedding: str) -> Any:
+        """
+        Build the retrieval RPC call. With a ranked match function configured
+        the database applies the UCB1 bonus and returns only top_k rows;
+        otherwise match_documents returns 2x top_k candidates for _rerank.
+        """
+        if settings.ranked_match_function:
+            return get_supabase_client().rpc(
+                settings.ranked_match_function,
+                {
+                    "query_embedding": query_embedding,
+                    "match_count": self.top_k,
+                    "filter": self._filter(),
+                    "feedback_bonus": get_feedback_bonus(),
+                },
+            ).select(*_MATCH_COLUMNS, "ucb1_score", "final_score")
+        return get_supabase_client().rpc(
             settings.match_function,
             {
                 "query_embedding": query_embedding,
                 "match_count": self.top_k * 2,
-                "filter": {},
+                "filter": self._filter(),
             },
-        ).execute()
+        ).select(*_MATCH_COLUMNS)
+
+    def _rerank(self, rows: List[Dict[str, Any]]) -> List[Document]:
+        """Combine vector similarity with UCB1 scores and keep the top_k."""
+        if settings.ranked_match_function:
+            return self._ranked_documents(rows)
+
+        # Build candidates (url resolved once per chunk)
+        candidates: List[_Candidate] = []
+        for row in rows:
+            metadata = row.get("metadata") or {}
+            doc = Document(page_content=row["content"], metadata=metadata)
+            candidates.append(
+                _Candidate(doc, metadata.get("url", ""), float(row.get("similarity", 0.0)))
+            )
 
-        # 3. Build (Document, vector_score) pairs
-        docs_with_scores: List[tuple] = []
-        for row in response.data:
+        # Apply UCB1 re-ranking as one vectorised add + argsort
+        vector_scores = np.fromiter(
+            (c.vector_score for c in candidates), dtype=np.float64, count=len(candidates)
+        )
+        ucb1_scores = get_feedback_score_array([c.url for c in candidates])
+        final_scores = vector_scores + ucb1_scores
+        order = np.argsort(-final_scores, kind="stable")[: self.top_k]
+
+        docs: List[Document] = []
+        for i in order.tolist():
+            doc = candidates[i].doc
+            doc.metadata["vector_score"] = round(float(vector_scores[i]), 4)
+            doc.metadata["ucb1_score"] = round(float(ucb1_scores[i]), 4)
+            doc.metadata["final_score"] = round(float(final_scores[i]), 4)
+            docs.append(doc)
+        return docs
+
+    def _ranked_documents(self, rows: List[Dict[str, Any]]) -> List[Document]:
+        """Wrap rows the ranked match function already scored and ordered."""
+        docs: List[Document] = []
+        for row in rows:
             doc = Document(
                 page_content=row["content"],
                 metadata=row.get("metadata") or {},
             )
-            docs_with_scores.append((doc, float(row.get("similarity", 0.0))))
+            doc.metadata["vector_score"] = round(float(row.get("similarity", 0.0)), 4)
+            doc.metadata["ucb1_score"] = round(float(row.get("ucb1_score", 0.0)), 4)
+            doc.metadata["final_score"] = round(float(row.get("final_score", 0.0)), 4)
+            docs.append(doc)
+        return docs
 
-        # 4. Apply UCB1 re-ranking
-        urls = [doc.metadata.get("url", "") for doc, _ in docs_with_scores]
-        ucb_scores = get_feedback_scores(urls)
+    def _get_relevant_documents(self, query: str) -> List[Document]:
+        # 1. Embed the query (cached for repeated queries)
+        query_embedding = embed_query(query)
 
-        ranked: List[tuple] = []
-        for doc, vector_score in docs_with_scores:
-            url = doc.metadata.get("url", "")
-            ucb1 = ucb_scores.get(url, 0.0)
-            final_score = vector_score + ucb1
-            doc.metadata["vector_score"] = round(vector_score, 4)
-            doc.metadata["ucb1_score"] = round(ucb1, 4)
-            doc.metadata["final_score"] = round(final_score, 4)
-            ranked.append((doc, final_score))
+        # 2. Fetch candidates via the match RPC
+        response = self._match_documents(query_embedding).execute()
 
-        ranked.sort(key=lambda x: x[1], reverse=True)
-        return [doc for doc, _ in ranked[: self.top_k]]
+        # 3. Re-rank with UCB1 bandit scores
+        return self._rerank(response.data)
 
     async def _aget_relevant_documents(self, query: str) -> List[Document]:
-        return self._get_relevant_documents(query)
+        # 1. Embed the query; on a cold start the bandit's Supabase load
+        #    runs at the same time instead of after the RPC
+        query_embedding, _ = await asyncio.gather(
+            aembed_query(query),
+            asyncio.to_thread(get_bandit),
+        )
+
+        # 2. Build and run the blocking Supabase RPC off the event loop
+        #    (the ranked RPC's feedback bonus is gathered under the bandit lock)
+        response = await asyncio.to_thread(
+            lambda: self._match_documents(query_embedding).execute()
+        )
+
+        # 3. Re-rank with UCB1 bandit scores
+        return self._rerank(response.data)
 
 
 @lru_cache()
 def get_llm() -> ChatGoogleGenerativeAI:
     """Cached Gemini LLM instance."""
-    settings = get_settings()
     return ChatGoogleGenerativeAI(
         model=settings.gemini_model,
         google_api_key=settings.gemini_api_key,
@@ -99,25 +176,32 @@ def get_llm() -> ChatGoogleGenerativeAI:
     )
 
 
-def run_rag_pipeline(query: str, top_k: int = 5) -> Dict[str, Any]:
+@lru_cache()
+def get_chain() -> Runnable:
+    """Cached LCEL chain (prompt | LLM | parser), composed once on first use."""
+    return BI_ASSISTANT_PROMPT | get_llm() | StrOutputParser()
+
+
+async def run_rag_pipeline(
+    query: str, top_k: int = 5, company: Optional[str] = None
+) -> Dict[str, Any]:
     """
     Full RAG pipeline:
-      1. Retrieve feedback-aware docs from Supabase (match_documents RPC).
+      1. Retrieve feedback-aware docs from Supabase (match_documents RPC),
+         optionally restricted to one company.
       2. Build context block.
       3. Run LCEL chain (prompt | LLM | parser).
       4. Return answer, sources, scores, and model name.
     """
-    settings = get_settings()
-    retriever = FeedbackAwareRetriever(top_k=top_k)
-    docs = retriever.invoke(query)
+    retriever = FeedbackAwareRetriever(top_k=top_k, company=company)
+    docs = await retriever.ainvoke(query)
 
     context = "\n\n".join(
         f"Source: {doc.metadata.get('url', 'unknown')}\nContent: {doc.page_content}"
         for doc in docs
     )
 
-    chain = BI_ASSISTANT_PROMPT | get_llm() | StrOutputParser()
-    answer = chain.invoke({"context": context, "query": query})
+    answer = await get_chain().ainvoke({"context": context, "query": query})
 
     return {
         "answer": answer,
@@ -36,6 +36,8 @@ if "feedback_type" not in st.session_state:
     st.session_state.feedback_type = None
 if "current_query" not in st.session_state:
     st.session_state.current_query = ""
+if "http_session" not in st.session_state:
+    st.session_state.http_session = requests.Session()   # per-user keep-alive
 
 
 # ---------------------------------------------------------------------------
@@ -43,9 +45,18 @@ if "current_query" not in st.session_state:
 # ---------------------------------------------------------------------------
 
 
+def get_session() -> requests.Session:
+    """
+    This user's HTTP session: keeps the backend connection alive across
+    reruns. Held per user rather than cached globally because
+    requests.Session is not guaranteed to be thread-safe.
+    """
+    return st.session_state.http_session
+
+
 def check_health() -> dict:
     try:
-        r = requests.get(f"{BACKEND_URL}/health", timeout=3)
+        r = get_session().get(f"{BACKEND_URL}/health", timeout=3)
         return r.json()
     except Exception:
         return {"status": "unreachable", "supabase": "unreachable"}
@@ -53,7 +64,7 @@ def check_health() -> dict:
 
 def ask_question(query: str, top_k: int) -> dict | None:
     try:
-        r = requests.post(
+        r = get_session().post(
             f"{BACKEND_URL}/ask",
             json={"query": query, "top_k": top_k},
             timeout=60,
@@ -69,7 +80,7 @@ def ask_question(query: str, top_k: int) -> dict | None:
 
 def send_feedback(result: dict, query: str, feedback_type: str) -> bool:
     try:
-        r = requests.post(
+        r = get_session().post(
             f"{BACKEND_URL}/feedback",
             json={
                 "query": query,
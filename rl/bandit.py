@@ -1,6 +1,25 @@
 import math
 import json
-from typing import Dict, Any
+from itertools import chain
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+
+def _ucb1_scores(pulls: np.ndarray, rewards: np.ndarray, total_pulls: int) -> np.ndarray:
+    """
+    UCB1 score of every arm in one pass (same formula as get_score):
+    ln(N) is computed once and the per-arm mean and bonus are array ops.
+    """
+    scores = np.zeros(pulls.shape, dtype=np.float32)
+    pulled = pulls > 0
+    mean_reward = rewards[pulled] / pulls[pulled]
+    if total_pulls <= 1:
+        scores[pulled] = mean_reward
+    else:
+        scores[pulled] = mean_reward + np.sqrt(2 * math.log(total_pulls) / pulls[pulled])
+    return scores
 
 
 class UCB1Bandit:
@@ -12,17 +31,35 @@ class UCB1Bandit:
     reward) with exploration (uncertainty bonus).
     """
 
+    _INITIAL_CAPACITY = 1024
+
     def __init__(self):
-        self._arms: Dict[str, Dict[str, float]] = {}
+        # Structure-of-arrays: arm i's counters live at _pulls[i] / _rewards[i]
+        self._url_to_idx: Dict[str, int] = {}
+        self._pulls = np.zeros(self._INITIAL_CAPACITY, dtype=np.int32)
+        self._rewards = np.zeros(self._INITIAL_CAPACITY, dtype=np.float32)
         self._total_pulls: int = 0
+        # Packed score cache for bulk lookups; rebuilt lazily after update()
+        self._scores: Optional[np.ndarray] = None
+
+    def _append(self, arm_id: str) -> int:
+        """Assign the next slot to a new arm, doubling the arrays when full."""
+        i = len(self._url_to_idx)
+        if i == self._pulls.size:
+            self._pulls = np.concatenate([self._pulls, np.zeros_like(self._pulls)])
+            self._rewards = np.concatenate([self._rewards, np.zeros_like(self._rewards)])
+        self._url_to_idx[arm_id] = i
+        return i
 
     def update(self, arm_id: str, reward: float) -> None:
         """Record a reward observation for the given arm."""
-        if arm_id not in self._arms:
-            self._arms[arm_id] = {"pulls": 0, "total_reward": 0.0}
-        self._arms[arm_id]["pulls"] += 1
-        self._arms[arm_id]["total_reward"] += reward
+        i = self._url_to_idx.get(arm_id)
+        if i is None:
+            i = self._append(arm_id)
+        self._pulls[i] += 1
+        self._rewards[i] += reward
         self._total_pulls += 1
+        self._scores = None
 
     def get_score(self, arm_id: str) -> float:
         """
@@ -31,42 +68,108 @@ class UCB1Bandit:
 
         Returns 0.0 for arms that have never been pulled.
         """
-        if arm_id not in self._arms or self._arms[arm_id]["pulls"] == 0:
+        i = self._url_to_idx.get(arm_id)
+        if i is None or self._pulls[i] == 0:
             return 0.0
 
-        arm = self._arms[arm_id]
-        mean_reward = arm["total_reward"] / arm["pulls"]
+        pulls = int(self._pulls[i])
+        mean_reward = float(self._rewards[i]) / pulls
 
         if self._total_pulls <= 1:
             return mean_reward
 
-        exploration = math.sqrt(2 * math.log(self._total_pulls) / arm["pulls"])
+        exploration = math.sqrt(2 * math.log(self._total_pulls) / pulls)
         return mean_reward + exploration
 
+    def _refresh_scores(self) -> np.ndarray:
+        """Rebuild the packed score array if an update invalidated it."""
+        if self._scores is None:
+            n = len(self._url_to_idx)
+            self._scores = _ucb1_scores(
+                self._pulls[:n], self._rewards[:n], self._total_pulls
+            )
+        return self._scores
+
+    def score_many(self, arm_ids: List[str]) -> np.ndarray:
+        """
+        Vectorised get_score: gather the cached scores for many arms at once.
+        Arms that have never been pulled score 0.0.
+        """
+        scores = self._refresh_scores()
+        if not scores.size:
+            return np.zeros(len(arm_ids), dtype=np.float32)
+        idx = np.fromiter(
+            (self._url_to_idx.get(arm_id, -1) for arm_id in arm_ids),
+            dtype=np.int64,
+            count=len(arm_ids),
+        )
+        return np.where(idx >= 0, scores[idx], np.float32(0.0))
+
+    def get_scores(self, limit: Optional[int] = None) -> Dict[str, float]:
+        """
+        Return the UCB1 score of every arm seen so far, or of only the
+        `limit` highest-scoring arms.
+        """
+        scores = self._refresh_scores()
+        if limit is None or limit >= scores.size:
+            return dict(zip(self._url_to_idx, scores.tolist()))
+        if limit <= 0:
+            return {}
+        urls = list(self._url_to_idx)
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        return {urls[i]: float(scores[i]) for i in top.tolist()}
+
+    def update_many(self, arm_ids: List[str], rewards: ArrayLike) -> None:
+        """Record many reward observations at once (bulk form of update)."""
+        if not arm_ids:
+            return
+        idx = np.array(
+            [
+                i if (i := self._url_to_idx.get(arm_id)) is not None else self._append(arm_id)
+                for arm_id in arm_ids
+            ],
+            dtype=np.int64,
+        )
+        # add.at accumulates repeated indices, unlike fancy-index +=
+        np.add.at(self._pulls, idx, 1)
+        np.add.at(self._rewards, idx, np.asarray(rewards, dtype=np.float32))
+        self._total_pulls += len(arm_ids)
+        self._scores = None
+
     def load_from_supabase(self, client: Any, feedback_table: str) -> None:
         """Rebuild bandit state from all historical feedback stored in Supabase."""
         try:
             page_size = 1000
-            offset = 0
+            last_feedback_id = None
             count = 0
             while True:
-                response = (
+                # Keyset pagination on feedback_id (unique, written by every
+                # store_feedback call): each page seeks past the last one
+                # seen, so Postgres never re-scans skipped rows as OFFSET would.
+                # Rows without one could not be paged past, so they are skipped.
+                query = (
                     client.table(feedback_table)
-                    .select("sources, feedback")
-                    .range(offset, offset + page_size - 1)
-                    .execute()
+                    .select("feedback_id, sources, feedback")
+                    .not_.is_("feedback_id", "null")
+                    .order("feedback_id")
+                    .limit(page_size)
                 )
-                rows = response.data
+                if last_feedback_id is not None:
+                    query = query.gt("feedback_id", last_feedback_id)
+                rows = query.execute().data
                 if not rows:
                     break
-                for row in rows:
-                    sources = row.get("sources") or []
-                    feedback = row.get("feedback", "")
-                    reward = 1.0 if feedback == "positive" else 0.0
-                    for url in sources:
-                        self.update(url, reward)
-                    count += 1
-                offset += page_size
+                # Flatten the page: one reward per row, repeated for each source
+                sources = [row.get("sources") or [] for row in rows]
+                row_rewards = np.fromiter(
+                    (row.get("feedback", "") == "positive" for row in rows),
+                    dtype=np.float32,
+                    count=len(rows),
+                )
+                rewards = np.repeat(row_rewards, [len(s) for s in sources])
+                self.update_many(list(chain.from_iterable(sources)), rewards)
+                count += len(rows)
+                last_feedback_id = rows[-1]["feedback_id"]
                 if len(rows) < page_size:
                     break
             print(f"[UCB1Bandit] Loaded {count} feedback records from Supabase")
@@ -76,7 +179,13 @@ class UCB1Bandit:
 
     def save_to_json(self, path: str) -> None:
         """Persist bandit state to a JSON file (debug helper)."""
-        data = {"arms": self._arms, "total_pulls": self._total_pulls}
+        n = len(self._url_to_idx)
+        data = {
+            "urls": list(self._url_to_idx),
+            "pulls": self._pulls[:n].tolist(),
+            "rewards": self._rewards[:n].tolist(),
+            "total_pulls": self._total_pulls,
+        }
         with open(path, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2)
         print(f"[UCB1Bandit] Saved state to {path}")
@@ -85,6 +194,22 @@ class UCB1Bandit:
         """Restore bandit state from a JSON file (debug helper)."""
         with open(path, encoding="utf-8") as f:
             data = json.load(f)
-        self._arms = data.get("arms", {})
+        if "arms" in data:
+            # Older dumps stored one {"pulls", "total_reward"} dict per arm
+            arms = data["arms"]
+            urls = list(arms)
+            pulls = [arm["pulls"] for arm in arms.values()]
+            rewards = [arm["total_reward"] for arm in arms.values()]
+        else:
+            urls = data.get("urls", [])
+            pulls = data.get("pulls", [])
+            rewards = data.get("rewards", [])
+        capacity = max(self._INITIAL_CAPACITY, len(urls))
+        self._url_to_idx = {url: i for i, url in enumerate(urls)}
+        self._pulls = np.zeros(capacity, dtype=np.int32)
+        self._rewards = np.zeros(capacity, dtype=np.float32)
+        self._pulls[: len(urls)] = pulls
+        self._rewards[: len(urls)] = rewards
         self._total_pulls = data.get("total_pulls", 0)
-        print(f"[UCB1Bandit] Loaded state from {path} ({len(self._arms)} arms)")
+        self._scores = None
+        print(f"[UCB1Bandit] Loaded state from {path} ({len(urls)} arms)")
@@ -0,0 +1,37 @@
+-- documents_embedding_idx
+-- ========================
+-- HNSW approximate-nearest-neighbour index on the chunk embeddings. Without
+-- it every match_documents call computes the distance to every row in the
+-- table; with it Postgres walks the HNSW graph instead.
+--
+-- Embeddings are L2-normalised, so the index uses inner-product ops
+-- (cosine == dot product, without the per-row norm). The graph is built
+-- over a half-precision copy of each vector (pgvector >= 0.7): 768 bytes
+-- per chunk instead of 1,536, so twice as much of the graph stays in
+-- shared buffers, with negligible recall loss for MiniLM embeddings. The
+-- column itself stays vector(384), so the returned similarity is still
+-- computed at full precision.
+--
+-- The index is only used when the query orders by the same expression,
+-- i.e. `order by embedding::halfvec(384) <#> query_embedding::halfvec(384)
+-- limit n`, as both match functions do. hnsw.ef_search (default 40) must
+-- stay >= the number of candidates requested (2 x top_k, at most 40).
+--
+-- Run once in the Supabase SQL editor. If an earlier full-precision build
+-- of this index exists, `drop index documents_embedding_idx;` first.
+-- With REBUILD_INDEX_ON_INGEST the ingestion pipeline drops and recreates
+-- this index itself (workflows/langgraph_pipeline.py, EMBEDDING_INDEX_DDL,
+-- named <DOCUMENTS_TABLE>_embedding_idx); keep the two definitions in sync.
+
+create index if not exists documents_embedding_idx
+  on documents using hnsw ((embedding::halfvec(384)) halfvec_ip_ops)
+  with (m = 16, ef_construction = 64);
+
+-- Company-filtered queries (`filter = {"company": ...}`) match on
+-- metadata @> filter. When the planner uses the HNSW index the filter is
+-- still applied to its results; the match functions enable iterative scans
+-- (pgvector >= 0.8) so enough rows survive. This GIN index only helps when
+-- the planner instead picks the filter first (e.g. a very selective
+-- filter) and sorts those rows exactly; it does not prevent post-filtering.
+create index if not exists documents_metadata_idx
+  on documents using gin (metadata jsonb_path_ops);
@@ -0,0 +1,43 @@
+-- match_documents
+-- ================
+-- Reference definition of the RPC the backend calls for vector search.
+-- Embeddings are L2-normalised at both ingest and query time, so the inner
+-- product equals cosine similarity; ordering by the negative-inner-product
+-- operator (<#>) skips cosine's per-row norm computation. The ordering runs
+-- on half-precision casts so it is served by the halfvec_ip_ops HNSW index
+-- in documents_embedding_index.sql; the returned similarity uses the
+-- full-precision column.
+--
+-- A company filter (metadata @> filter) is applied to the rows the HNSW
+-- scan returns, and a single scan yields only hnsw.ef_search (40)
+-- candidates, so a narrow filter would leave few or no matches. Iterative
+-- scans (pgvector >= 0.8) keep walking the graph until match_count rows
+-- pass the filter. relaxed_order may return rows slightly out of distance
+-- order; the backend re-ranks them by final score anyway.
+--
+-- Run once in the Supabase SQL editor.
+
+create or replace function match_documents(
+  query_embedding vector(384),
+  match_count int default 5,
+  filter jsonb default '{}'
+)
+returns table (
+  id bigint,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+language sql stable
+set hnsw.iterative_scan = relaxed_order
+as $$
+  select
+    documents.id,
+    documents.content,
+    documents.metadata,
+    -(documents.embedding <#> query_embedding) as similarity
+  from documents
+  where documents.metadata @> filter
+  order by documents.embedding::halfvec(384) <#> query_embedding::halfvec(384)
+  limit match_count;
+$$;
@@ -0,0 +1,58 @@
+-- match_documents_ranked
+-- =======================
+-- Vector search + UCB1 feedback re-ranking in a single RPC. Picks the
+-- 2 x match_count nearest chunks, adds the per-URL bandit bonus passed in
+-- `feedback_bonus` ({"<url>": <ucb1 score>}; the backend sends only the
+-- RANKED_MATCH_BONUS_LIMIT highest-scoring URLs, the rest get no bonus),
+-- and returns only the top match_count rows ordered by the combined score.
+-- Similarity is the inner product of the normalised embeddings (= cosine),
+-- as in match_documents.sql, which also explains the iterative HNSW scan
+-- that keeps company-filtered searches from running short of candidates.
+--
+-- Run once in the Supabase SQL editor, then set
+--   RANKED_MATCH_FUNCTION=match_documents_ranked
+-- in .env. Without it the backend falls back to match_documents and
+-- re-ranks in Python.
+
+create or replace function match_documents_ranked(
+  query_embedding vector(384),
+  match_count int default 5,
+  filter jsonb default '{}',
+  feedback_bonus jsonb default '{}'
+)
+returns table (
+  id bigint,
+  content text,
+  metadata jsonb,
+  similarity float,
+  ucb1_score float,
+  final_score float
+)
+language sql stable
+set hnsw.iterative_scan = relaxed_order
+as $$
+  with candidates as (
+    select
+      documents.id,
+      documents.content,
+      documents.metadata,
+      -(documents.embedding <#> query_embedding) as similarity
+    from documents
+    where documents.metadata @> filter
+    order by documents.embedding::halfvec(384) <#> query_embedding::halfvec(384)
+    limit match_count * 2
+  )
+  select
+    candidates.id,
+    candidates.content,
+    candidates.metadata,
+    candidates.similarity,
+    bonus.value as ucb1_score,
+    candidates.similarity + bonus.value as final_score
+  from candidates
+  cross join lateral (
+    select coalesce((feedback_bonus ->> (candidates.metadata ->> 'url'))::float, 0) as value
+  ) as bonus
+  order by final_score desc
+  limit match_count;
+$$;
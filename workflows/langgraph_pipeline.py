@@ -9,18 +9,28 @@ Run:
     python -m workflows.langgraph_pipeline
 """
 
+import asyncio
 import hashlib
 import json
+import operator
+import os
+import re
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, TypedDict
+from functools import lru_cache
+from typing import Annotated, Any, Dict, List, Optional, Tuple, TypedDict
 
 from eventregistry import EventRegistry, QueryArticlesIter
 from langchain_core.documents import Document
-from langchain_core.messages import HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable, RunnableLambda
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langdetect import detect
 from langgraph.graph import END, StateGraph
+import numpy as np
+import orjson
 
 COMPANIES = [
     "OpenAI",
@@ -49,23 +59,37 @@ def _get_embeddings():
     return get_embeddings()
 
 
+def _get_tokenizer():
+    from backend.services.embeddings import get_tokenizer
+    return get_tokenizer()
+
+
 def _get_supabase_client():
     from backend.services.feedback_rl import get_supabase_client
     return get_supabase_client()
 
 
+def _to_pgvector(embedding):
+    from backend.services.embeddings import to_pgvector
+    return to_pgvector(embedding, decimals=EMBEDDING_LITERAL_DECIMALS)
+
+
 # ---------------------------------------------------------------------------
 # Pipeline state
 # ---------------------------------------------------------------------------
 
 
 class PipelineState(TypedDict):
+    """
+    Shared graph state. Nodes return only the keys they change; LangGraph
+    overwrites those and appends to `errors` (operator.add reducer).
+    """
+
     raw_articles: List[Dict[str, Any]]
     translated_articles: List[Dict[str, Any]]
     documents: List[Document]
-    embeddings: List[List[float]]
     indexed_count: int
-    errors: List[str]
+    errors: Annotated[List[str], operator.add]
     settings: Optional[Any]
 
 
@@ -74,63 +98,82 @@ class PipelineState(TypedDict):
 # ---------------------------------------------------------------------------
 
 
-def fetch_articles(state: PipelineState) -> PipelineState:
+def _fetch_company(
+    company: str, date_start: str, date_end: str, settings: Any
+) -> List[Dict[str, Any]]:
+    """Fetch one company's articles from EventRegistry."""
+    # One client per company: EventRegistry serialises requests on a
+    # per-instance lock, so a shared client would undo the parallelism.
+    er = EventRegistry(apiKey=settings.event_registry_api_key, allowUseOfArchive=True)
+    query = QueryArticlesIter(
+        keywords=company,
+        dateStart=date_start,
+        dateEnd=date_end,
+        lang=["eng", "spa", "fra", "deu", "zho"],
+    )
+    return [
+        {
+            "source": art.get("source", {}).get("title", ""),
+            "company": company,
+            "title": art.get("title"),
+            "date": art.get("dateTime"),
+            "url": art.get("url"),
+            "content": art.get("body"),
+        }
+        for art in query.execQuery(er, maxItems=settings.news_max_items_per_company)
+    ]
+
+
+def fetch_articles(state: PipelineState) -> Dict[str, Any]:
     """
     Fetch the latest articles from EventRegistry for each company in COMPANIES
-    and save them to the configured JSON path. Downstream load_articles reads
-    this file, so the rest of the pipeline is unchanged.
+    and save them to the configured path as NDJSON (one article per line).
+    Companies are queried concurrently since each query is independent and
+    network-bound, at most NEWS_FETCH_CONCURRENCY at a time. Downstream
+    load_articles reads this file, so the rest of the pipeline is unchanged.
     """
     settings = state.get("settings") or _get_settings()
     date_end = datetime.utcnow().strftime("%Y-%m-%d")
     date_start = (datetime.utcnow() - timedelta(days=settings.news_lookback_days)).strftime("%Y-%m-%d")
     print(f"[fetch_articles] Fetching articles from {date_start} to {date_end}")
 
+    total = 0
+    errors: List[str] = []
+    workers = max(1, min(settings.news_fetch_concurrency, len(COMPANIES)))
     try:
-        er = EventRegistry(apiKey=settings.event_registry_api_key, allowUseOfArchive=True)
+        # NDJSON, one article per line, written as each company's results
+        # come in: only one company's articles are held at a time
+        with open(settings.articles_json_path, "wb") as f, ThreadPoolExecutor(
+            max_workers=workers
+        ) as executor:
+            futures = [
+                executor.submit(_fetch_company, company, date_start, date_end, settings)
+                for company in COMPANIES
+            ]
+            # Collect in COMPANIES order so the saved file is deterministic
+            for company, future in zip(COMPANIES, futures):
+                try:
+                    articles = future.result()
+                except Exception as exc:
+                    msg = f"[fetch_articles] Failed for company '{company}': {exc}"
+                    print(msg)
+                    errors.append(msg)
+                    continue
+                f.writelines(
+                    orjson.dumps(article, option=orjson.OPT_APPEND_NEWLINE)
+                    for article in articles
+                )
+                total += len(articles)
+                print(f"[fetch_articles]   {company}: {len(articles)} articles")
     except Exception as exc:
-        msg = f"[fetch_articles] Failed to initialise EventRegistry: {exc}"
+        msg = f"[fetch_articles] Failed to save articles: {exc}"
         print(msg)
-        return {**state, "errors": state["errors"] + [msg], "settings": settings}
-
-    all_articles = []
-    for company in COMPANIES:
-        print(f"[fetch_articles]   Fetching: {company} ...")
-        try:
-            query = QueryArticlesIter(
-                keywords=company,
-                dateStart=date_start,
-                dateEnd=date_end,
-                lang=["eng", "spa", "fra", "deu", "zho"],
-            )
-            count = 0
-            for art in query.execQuery(er, maxItems=settings.news_max_items_per_company):
-                all_articles.append({
-                    "source": art.get("source", {}).get("title", ""),
-                    "company": company,
-                    "title": art.get("title"),
-                    "date": art.get("dateTime"),
-                    "url": art.get("url"),
-                    "content": art.get("body"),
-                })
-                count += 1
-            print(f"[fetch_articles]     -> {count} articles")
-        except Exception as exc:
-            msg = f"[fetch_articles] Failed for company '{company}': {exc}"
-            print(msg)
-            state["errors"].append(msg)
+        return {"errors": errors + [msg], "settings": settings}
 
-    print(f"[fetch_articles] Total fetched: {len(all_articles)} articles")
+    print(f"[fetch_articles] Total fetched: {total} articles")
+    print(f"[fetch_articles] Saved to {settings.articles_json_path}")
 
-    try:
-        with open(settings.articles_json_path, "w", encoding="utf-8") as f:
-            json.dump(all_articles, f, indent=2, ensure_ascii=False)
-        print(f"[fetch_articles] Saved to {settings.articles_json_path}")
-    except Exception as exc:
-        msg = f"[fetch_articles] Failed to save JSON: {exc}"
-        print(msg)
-        return {**state, "errors": state["errors"] + [msg], "settings": settings}
-
-    return {**state, "settings": settings}
+    return {"errors": errors, "settings": settings}
 
 
 # ---------------------------------------------------------------------------
@@ -138,23 +181,55 @@ def fetch_articles(state: PipelineState) -> PipelineState:
 # ---------------------------------------------------------------------------
 
 
-def load_articles(state: PipelineState) -> PipelineState:
+def load_articles(state: PipelineState) -> Dict[str, Any]:
     settings = state.get("settings") or _get_settings()
     path = settings.articles_json_path
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            articles = json.load(f)
+        with open(path, "rb") as f:
+            if f.read(1) == b"[":
+                # Files written before the switch to NDJSON hold one array
+                f.seek(0)
+                articles = orjson.loads(f.read())
+            else:
+                f.seek(0)
+                articles = [orjson.loads(line) for line in f if line.strip()]
         print(f"[load_articles] Loaded {len(articles)} articles from {path}")
-        return {**state, "raw_articles": articles, "settings": settings}
+        return {"raw_articles": articles, "settings": settings}
     except Exception as exc:
         msg = f"[load_articles] Failed to load {path}: {exc}"
         print(msg)
-        return {
-            **state,
-            "raw_articles": [],
-            "errors": state["errors"] + [msg],
-            "settings": settings,
-        }
+        return {"raw_articles": [], "errors": [msg], "settings": settings}
+
+
+# ---------------------------------------------------------------------------
+# Node: dedupe_articles
+# ---------------------------------------------------------------------------
+
+
+def dedupe_articles(state: PipelineState) -> Dict[str, Any]:
+    """
+    Keep the first occurrence of each article before translation and
+    embedding. A story matching several company queries is returned once
+    per company; its chunks share doc_ids, so the duplicates would only be
+    collapsed by the upsert, after paying for translation and embedding.
+    Articles without a URL are keyed by a hash of their body.
+    """
+    articles = state["raw_articles"]
+    seen = set()
+    unique = []
+    for article in articles:
+        key = article.get("url") or hashlib.sha256(
+            (article.get("body") or article.get("content") or "").encode()
+        ).hexdigest()
+        if key not in seen:
+            seen.add(key)
+            unique.append(article)
+
+    print(
+        f"[dedupe_articles] Kept {len(unique)} of {len(articles)} articles "
+        f"({len(articles) - len(unique)} duplicates)"
+    )
+    return {"raw_articles": unique}
 
 
 # ---------------------------------------------------------------------------
@@ -162,40 +237,187 @@ def load_articles(state: PipelineState) -> PipelineState:
 # ---------------------------------------------------------------------------
 
 
-def translate_non_english(state: PipelineState) -> PipelineState:
-    settings = state.get("settings") or _get_settings()
-    llm = ChatGoogleGenerativeAI(
+# Articles packed into one translation prompt
+TRANSLATION_BATCH_SIZE = 8
+# Translation prompts in flight at once (Gemini per-minute request quota)
+TRANSLATION_CONCURRENCY = 8
+# langdetect profiles for the languages _fetch_company requests
+LANGDETECT_PROFILES = ("en", "es", "fr", "de", "zh-cn", "zh-tw")
+
+
+@lru_cache()
+def _init_langdetect() -> None:
+    """
+    Install a langdetect factory holding only LANGDETECT_PROFILES instead of
+    all 55 bundled profiles: less memory, and fewer candidate languages to
+    score per n-gram. Seeded so repeated runs detect the same languages.
+    """
+    from langdetect import detector_factory
+
+    profiles = []
+    for lang in LANGDETECT_PROFILES:
+        path = os.path.join(detector_factory.PROFILES_DIRECTORY, lang)
+        with open(path, encoding="utf-8") as f:
+            profiles.append(f.read())
+    factory = detector_factory.DetectorFactory()
+    factory.load_json_profile(profiles)
+    factory.set_seed(0)
+    detector_factory._factory = factory
+
+
+@lru_cache(maxsize=8192)
+def _detect_lang(prefix: str) -> str:
+    """Language of an article lead; syndicated duplicates hit the cache."""
+    try:
+        return detect(prefix)
+    except Exception:
+        return "en"
+
+
+@lru_cache()
+def _get_translation_llm() -> ChatGoogleGenerativeAI:
+    """Cached Gemini client for translation (JSON replies, deterministic)."""
+    settings = _get_settings()
+    return ChatGoogleGenerativeAI(
         model=settings.gemini_translation_model,
         google_api_key=settings.gemini_api_key,
         temperature=0.0,
+        response_mime_type="application/json",
     )
 
-    translated = []
-    for article in state["raw_articles"]:
-        content = article.get("body") or article.get("content", "")
-        try:
-            lang = detect(content[:500]) if content else "en"
-        except Exception:
-            lang = "en"
 
-        if lang != "en" and content:
-            try:
-                msg = HumanMessage(
-                    content=(
-                        "Translate the following text to English. "
-                        "Return only the translation:\n\n"
-                        + content[:3000]
-                    )
-                )
-                response = llm.invoke([msg])
-                article = {**article, "body": response.content, "original_lang": lang}
-            except Exception as exc:
-                print(f"[translate] Failed for article '{article.get('title', '')}': {exc}")
+TRANSLATION_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "human",
+            "Translate each string in the following JSON array to English. "
+            "Return only a JSON array of the translated strings, in the same "
+            "order and with the same number of items:\n\n{texts}",
+        )
+    ]
+)
+
+
+def _parse_json_array(text: str) -> List[Any]:
+    """Parse a JSON array reply, tolerating prose or code fences around it."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        match = re.search(r"\[.*\]", text, re.DOTALL)
+        if not match:
+            raise
+        return json.loads(match.group(0))
+
+
+@lru_cache()
+def _get_translation_chain() -> Runnable:
+    """
+    Cached prompt | Gemini | JSON-array parser, composed once. Transient
+    errors and unparseable replies are retried with exponential backoff.
+    """
+    chain = (
+        TRANSLATION_PROMPT
+        | _get_translation_llm()
+        | StrOutputParser()
+        | RunnableLambda(_parse_json_array)
+    )
+    return chain.with_retry(stop_after_attempt=3, wait_exponential_jitter=True)
+
+
+def _check_translations(reply: Any, count: int) -> Optional[List[str]]:
+    """`reply` if it is a list of `count` strings, else None."""
+    if (
+        isinstance(reply, list)
+        and len(reply) == count
+        and all(isinstance(t, str) for t in reply)
+    ):
+        return reply
+    return None
+
 
-        translated.append(article)
+def _run_translation_chain(groups: List[List[str]]) -> List[Optional[List[str]]]:
+    """
+    One chain call per group of texts, TRANSLATION_CONCURRENCY at a time.
+    Returns each group's translations in order; None marks a failed group.
+    """
+    inputs = [
+        {"texts": json.dumps([c[:3000] for c in group], ensure_ascii=False)}
+        for group in groups
+    ]
+    replies = _get_translation_chain().batch(
+        inputs,
+        config={"max_concurrency": TRANSLATION_CONCURRENCY},
+        return_exceptions=True,
+    )
+    results = []
+    for group, reply in zip(groups, replies):
+        if isinstance(reply, Exception) and len(group) == 1:
+            print(f"[translate] Translation failed: {reply}")
+        results.append(_check_translations(reply, len(group)))
+    return results
+
+
+def _translate_groups(groups: List[List[str]]) -> List[List[Optional[str]]]:
+    """
+    Translate each group of texts with a single Gemini call. Returns
+    translations in input order; None marks a text that could not be
+    translated.
+    """
+    results = _run_translation_chain(groups)
+
+    # Malformed or mismatched batch reply: fall back to one text per call
+    retry = [
+        (g, text)
+        for g, (group, result) in enumerate(zip(groups, results))
+        if result is None and len(group) > 1
+        for text in group
+    ]
+    singles: Dict[int, List[Optional[str]]] = {}
+    for (g, _), single in zip(retry, _run_translation_chain([[t] for _, t in retry])):
+        singles.setdefault(g, []).append(single[0] if single else None)
+
+    return [
+        result if result is not None else singles.get(g, [None] * len(group))
+        for g, (group, result) in enumerate(zip(groups, results))
+    ]
+
+
+def translate_non_english(state: PipelineState) -> Dict[str, Any]:
+    """
+    Detect each article's language and translate non-English bodies via
+    Gemini. Articles are packed TRANSLATION_BATCH_SIZE per prompt (JSON in,
+    JSON out), sent through one precompiled chain with .batch() so up to
+    TRANSLATION_CONCURRENCY batches run at once, each retried with
+    exponential backoff.
+    """
+    articles = state["raw_articles"]
+    contents = [a.get("body") or a.get("content", "") for a in articles]
+    _init_langdetect()
+    langs = [_detect_lang(content[:500]) if content else "en" for content in contents]
+
+    pending = [
+        i for i, (content, lang) in enumerate(zip(contents, langs))
+        if lang != "en" and content
+    ]
+    batches = [
+        pending[i : i + TRANSLATION_BATCH_SIZE]
+        for i in range(0, len(pending), TRANSLATION_BATCH_SIZE)
+    ]
+
+    translated = list(articles)
+    results = _translate_groups([[contents[i] for i in batch] for batch in batches])
+    for batch, bodies in zip(batches, results):
+        for i, body in zip(batch, bodies):
+            if body is None:
+                print(f"[translate] Failed for article '{articles[i].get('title', '')}'")
+                continue
+            translated[i] = {**articles[i], "body": body, "original_lang": langs[i]}
 
-    print(f"[translate_non_english] Processed {len(translated)} articles")
-    return {**state, "translated_articles": translated}
+    print(
+        f"[translate_non_english] Processed {len(translated)} articles "
+        f"({len(pending)} non-English, sent in {len(batches)} batches)"
+    )
+    return {"translated_articles": translated}
 
 
 # ---------------------------------------------------------------------------
@@ -203,19 +425,89 @@ def translate_non_english(state: PipelineState) -> PipelineState:
 # ---------------------------------------------------------------------------
 
 
-def chunk_documents(state: PipelineState) -> PipelineState:
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=3200,
-        chunk_overlap=400,
+# Chunk sizes in embedding-model tokens. all-MiniLM-L6-v2 truncates input at
+# 256 tokens, two of which are [CLS]/[SEP]; longer chunks would lose their tail.
+CHUNK_TOKENS = 254
+CHUNK_OVERLAP_TOKENS = 32
+# Stored in each chunk's metadata; filter_existing only skips chunks indexed
+# under the same scheme. Change it whenever chunk boundaries or text change.
+CHUNK_SCHEME = "minilm-254-32"
+# A final chunk shorter than this is folded into the one before it
+MIN_CHUNK_TOKENS = 64
+# Bodies up to this long are checked for fitting one chunk before splitting;
+# at ~4-5 characters per token, anything longer is several chunks anyway
+SINGLE_CHUNK_MAX_CHARS = 1500
+# Longer bodies are truncated: they are scraped page dumps, not articles, and
+# the recursive splitter degrades badly on huge separator-poor text
+MAX_ARTICLE_CHARS = 200_000
+
+
+@lru_cache()
+def _get_splitter() -> RecursiveCharacterTextSplitter:
+    """Cached token-length splitter, built once per process."""
+    return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+        _get_tokenizer(),
+        chunk_size=CHUNK_TOKENS,
+        chunk_overlap=CHUNK_OVERLAP_TOKENS,
         separators=["\n\n", "\n", ". ", " ", ""],
     )
 
-    documents: List[Document] = []
-    for article in state["translated_articles"]:
-        content = article.get("body") or article.get("content", "")
-        if not content:
-            continue
 
+def _merge_tail(chunks: List[str]) -> List[str]:
+    """
+    Fold a short final chunk into the previous one when the result still
+    fits CHUNK_TOKENS. The recursive splitter packs every chunk but the
+    last, so that is where fragments (a trailing sentence or byline) end up;
+    on their own they embed poorly and cost a row each.
+    """
+    if len(chunks) < 2:
+        return chunks
+    tokenizer = _get_tokenizer()
+    prev, tail = chunks[-2], chunks[-1]
+    tail_tokens = len(tokenizer.tokenize(tail))
+    if tail_tokens >= MIN_CHUNK_TOKENS:
+        return chunks
+    if len(tokenizer.tokenize(prev)) + tail_tokens > CHUNK_TOKENS:
+        return chunks
+    # The tail usually opens with the overlap repeated from prev's end
+    for k in range(min(len(prev), len(tail)), 15, -1):
+        if prev.endswith(tail[:k]):
+            return chunks[:-2] + [prev + tail[k:]]
+    return chunks[:-2] + [f"{prev}\n{tail}"]
+
+
+@lru_cache(maxsize=4096)
+def _split_text(content: str) -> Tuple[str, ...]:
+    """
+    Split one article body. Memoised on the text: splitting tokenizes every
+    candidate piece, and syndicated articles repeat under several companies.
+    Short bodies that fit one chunk skip the splitter.
+    """
+    content = content[:MAX_ARTICLE_CHARS].strip()
+    if not content:
+        return ()
+    if (
+        len(content) <= SINGLE_CHUNK_MAX_CHARS
+        and len(_get_tokenizer().tokenize(content)) <= CHUNK_TOKENS
+    ):
+        return (content,)
+    return tuple(_merge_tail(_get_splitter().split_text(content)))
+
+
+def chunk_documents(state: PipelineState) -> Dict[str, Any]:
+    """
+    Split every article into token-sized chunks with deterministic doc_ids.
+    Splitting runs in this process so the loaded tokenizer and the
+    _split_text memo are shared by every article.
+    """
+    articles = [
+        a for a in state["translated_articles"] if a.get("body") or a.get("content")
+    ]
+    contents = [a.get("body") or a.get("content", "") for a in articles]
+    split_contents = [_split_text(content) for content in contents]
+
+    documents: List[Document] = []
+    for article, chunks in zip(articles, split_contents):
         url = article.get("url", "")
         title = article.get("title", "")
         source = article.get("source", {})
@@ -223,9 +515,14 @@ def chunk_documents(state: PipelineState) -> PipelineState:
             source.get("title", "") if isinstance(source, dict) else ""
         )
 
-        chunks = splitter.split_text(content)
+        # doc_id = sha256(f"{url}_{i}"): it is the upsert conflict key, so the
+        # scheme must not change. Hash the shared "{url}_" prefix once and
+        # extend a copy of that state with each chunk index.
+        url_hash = hashlib.sha256(f"{url}_".encode())
         for i, chunk in enumerate(chunks):
-            doc_id = hashlib.sha256(f"{url}_{i}".encode()).hexdigest()
+            chunk_hash = url_hash.copy()
+            chunk_hash.update(str(i).encode())
+            doc_id = chunk_hash.hexdigest()
             documents.append(
                 Document(
                     page_content=chunk,
@@ -234,7 +531,9 @@ def chunk_documents(state: PipelineState) -> PipelineState:
                         "title": title,
                         "company": company,
                         "chunk_index": i,
+                        "chunk_count": len(chunks),
                         "doc_id": doc_id,
+                        "chunk_scheme": CHUNK_SCHEME,
                     },
                 )
             )
@@ -243,78 +542,479 @@ def chunk_documents(state: PipelineState) -> PipelineState:
         f"[chunk_documents] Created {len(documents)} chunks "
         f"from {len(state['translated_articles'])} articles"
     )
-    return {**state, "documents": documents}
+    return {"documents": documents}
 
 
 # ---------------------------------------------------------------------------
-# Node: generate_embeddings
+# Node: filter_existing
 # ---------------------------------------------------------------------------
 
 
-def generate_embeddings(state: PipelineState) -> PipelineState:
-    emb_model = _get_embeddings()
-    texts = [doc.page_content for doc in state["documents"]]
+# doc_ids per lookup: one asyncpg ANY() array, or a REST in_() filter (which
+# travels in the URL, so it has to stay short)
+EXISTING_IDS_PG_BATCH_SIZE = 5000
+EXISTING_IDS_REST_BATCH_SIZE = 100
 
-    embeddings: List[List[float]] = []
-    batch_size = 64
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i : i + batch_size]
-        batch_embs = emb_model.embed_documents(batch)
-        embeddings.extend(batch_embs)
 
-    print(f"[generate_embeddings] Generated {len(embeddings)} embeddings")
-    return {**state, "embeddings": embeddings}
+async def _existing_doc_ids_postgres(settings: Any, doc_ids: List[str]) -> set:
+    import asyncpg
+
+    conn = await asyncpg.connect(settings.postgres_dsn, statement_cache_size=0)
+    try:
+        existing = set()
+        for start in range(0, len(doc_ids), EXISTING_IDS_PG_BATCH_SIZE):
+            rows = await conn.fetch(
+                f"select doc_id from {settings.documents_table} "
+                "where doc_id = any($1::text[]) and metadata->>'chunk_scheme' = $2",
+                doc_ids[start : start + EXISTING_IDS_PG_BATCH_SIZE],
+                CHUNK_SCHEME,
+            )
+            existing.update(row["doc_id"] for row in rows)
+        return existing
+    finally:
+        await conn.close()
+
+
+def _existing_doc_ids_rest(settings: Any, doc_ids: List[str]) -> set:
+    client = _get_supabase_client()
+
+    def lookup(start: int) -> List[str]:
+        response = (
+            client.table(settings.documents_table)
+            .select("doc_id")
+            .in_("doc_id", doc_ids[start : start + EXISTING_IDS_REST_BATCH_SIZE])
+            .eq("metadata->>chunk_scheme", CHUNK_SCHEME)
+            .execute()
+        )
+        return [row["doc_id"] for row in response.data]
+
+    existing = set()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for found in executor.map(
+            lookup, range(0, len(doc_ids), EXISTING_IDS_REST_BATCH_SIZE)
+        ):
+            existing.update(found)
+    return existing
+
+
+def filter_existing(state: PipelineState) -> Dict[str, Any]:
+    """
+    Drop chunks whose doc_id is already in the documents table under the
+    current CHUNK_SCHEME, so re-runs over overlapping date windows only
+    embed and upsert new chunks; rows from an older chunking are
+    overwritten. Set REINDEX_EXISTING after changing the embedding model to
+    re-embed everything. If the lookup fails, all chunks are kept.
+    """
+    settings = state.get("settings") or _get_settings()
+    documents = state["documents"]
+    if settings.reindex_existing or not documents:
+        return {}
+
+    doc_ids = [doc.metadata["doc_id"] for doc in documents]
+    try:
+        if settings.postgres_dsn:
+            existing = asyncio.run(_existing_doc_ids_postgres(settings, doc_ids))
+        else:
+            existing = _existing_doc_ids_rest(settings, doc_ids)
+    except Exception as exc:
+        msg = f"[filter_existing] Lookup failed, keeping all chunks: {exc}"
+        print(msg)
+        return {"errors": [msg]}
+
+    new_documents = [doc for doc in documents if doc.metadata["doc_id"] not in existing]
+    print(
+        f"[filter_existing] {len(documents) - len(new_documents)} of "
+        f"{len(documents)} chunks already indexed; {len(new_documents)} to embed"
+    )
+    return {"documents": new_documents}
 
 
 # ---------------------------------------------------------------------------
-# Node: index_to_supabase
+# Nodes: prepare_index / finalize_index (REBUILD_INDEX_ON_INGEST)
 # ---------------------------------------------------------------------------
 
 
-def index_to_supabase(state: PipelineState) -> PipelineState:
+# Must match sql/documents_embedding_index.sql (documents_embedding_idx on
+# the default table)
+EMBEDDING_INDEX_DDL = (
+    "create index if not exists {index} on {table} "
+    "using hnsw ((embedding::halfvec(384)) halfvec_ip_ops) "
+    "with (m = 16, ef_construction = 64)"
+)
+
+
+def _embedding_index_name(settings: Any) -> str:
+    return f"{settings.documents_table}_embedding_idx"
+
+
+async def _drop_index(dsn: str, index: str) -> None:
+    import asyncpg
+
+    conn = await asyncpg.connect(dsn, statement_cache_size=0)
+    try:
+        await conn.execute(f"drop index concurrently if exists {index}")
+    finally:
+        await conn.close()
+
+
+async def _build_index(dsn: str, index: str, table: str, work_mem: str) -> None:
     """
-    Upsert document chunks + pre-generated embeddings into Supabase.
-    Uses doc_id as the conflict target so re-runs are idempotent.
+    Build the index in one transaction. Supabase's transaction-mode pooler
+    may move each autocommitted statement to a different backend, so the
+    settings are made transaction-local (set_config(..., true) is SET LOCAL
+    with a bound value) to reach the CREATE INDEX.
+    """
+    import asyncpg
+
+    conn = await asyncpg.connect(dsn, statement_cache_size=0)
+    try:
+        async with conn.transaction():
+            await conn.execute(
+                "select set_config('maintenance_work_mem', $1, true)", work_mem
+            )
+            await conn.execute("set local max_parallel_maintenance_workers = 4")
+            await conn.execute(EMBEDDING_INDEX_DDL.format(index=index, table=table))
+    finally:
+        await conn.close()
+
+
+def _rebuilds_index(settings: Any) -> bool:
+    return settings.rebuild_index_on_ingest and bool(settings.postgres_dsn)
+
+
+def prepare_index(state: PipelineState) -> Dict[str, Any]:
+    """
+    For large backfills, drop the HNSW index before the upsert so Postgres
+    does not update the graph row by row; finalize_index rebuilds it once.
+    No-op unless REBUILD_INDEX_ON_INGEST and POSTGRES_DSN are set.
     """
     settings = state.get("settings") or _get_settings()
-    client = _get_supabase_client()
+    if not _rebuilds_index(settings) or not state["documents"]:
+        return {}
+    index = _embedding_index_name(settings)
+    try:
+        asyncio.run(_drop_index(settings.postgres_dsn, index))
+        print(f"[prepare_index] Dropped {index} for bulk load")
+        return {}
+    except Exception as exc:
+        msg = f"[prepare_index] Could not drop {index}: {exc}"
+        print(msg)
+        return {"errors": [msg]}
+
+
+def finalize_index(state: PipelineState) -> Dict[str, Any]:
+    """
+    Rebuild the HNSW index dropped by prepare_index in one pass, with
+    INDEX_BUILD_MAINTENANCE_WORK_MEM and parallel workers for the build.
+    Runs even if embed_and_index failed, so the table is never left without
+    its index. Until it finishes, searches fall back to a sequential scan.
+    """
+    settings = state.get("settings") or _get_settings()
+    if not _rebuilds_index(settings) or not state["documents"]:
+        return {}
+    index = _embedding_index_name(settings)
+    print(f"[finalize_index] Rebuilding {index}...")
+    try:
+        asyncio.run(
+            _build_index(
+                settings.postgres_dsn,
+                index,
+                settings.documents_table,
+                settings.index_build_maintenance_work_mem,
+            )
+        )
+        print(f"[finalize_index] Rebuilt {index}")
+        return {}
+    except Exception as exc:
+        msg = f"[finalize_index] Could not rebuild {index}: {exc}"
+        print(msg)
+        return {"errors": [msg]}
+
+
+# ---------------------------------------------------------------------------
+# Node: embed_and_index
+# ---------------------------------------------------------------------------
+
+
+# Chunks embedded and upserted per step. The encode still runs in batches
+# of 64; a window only bounds how many embeddings are alive at once.
+EMBED_WINDOW_SIZE = 2000
+
+# Embeddings are float16 by now; rounding their unit-norm components to four
+# decimals (error <= 5e-5) adds about as little and shortens each literal ~40%
+EMBEDDING_LITERAL_DECIMALS = 4
+
+# Rows per REST upsert request (keeps each body around 1-2 MB) and in flight
+REST_UPSERT_BATCH_SIZE = 100
+REST_UPSERT_CONCURRENCY = 4
+
+# Rows per asyncpg executemany (pipelined in one round-trip) and batches in flight
+PG_UPSERT_BATCH_SIZE = 500
+PG_UPSERT_CONCURRENCY = 2
+
+
+def _embed(documents: List[Document]) -> np.ndarray:
+    """
+    Embed chunks as one float16 array: 768 bytes per chunk instead of a list
+    of 384 Python floats (~12 KB); the rounding barely moves cosine scores.
+    sentence-transformers sorts the texts by length and encodes them in
+    batches of 64, so padding stays minimal.
+    """
+    texts = [doc.page_content for doc in documents]
+    return np.asarray(_get_embeddings().embed_documents(texts), dtype=np.float16)
+
+
+async def _upsert_postgres(
+    settings: Any, documents: List[Document], embeddings: np.ndarray, first_row: int
+) -> Tuple[int, List[str]]:
+    """
+    Upsert chunks over a direct Postgres connection (POSTGRES_DSN) instead
+    of one PostgREST request per 100 rows. Returns (rows upserted, errors).
+    """
+    import asyncpg
+
+    sql = f"""
+        insert into {settings.documents_table} (content, metadata, embedding, doc_id)
+        values ($1, $2::jsonb, $3::text::vector, $4)
+        on conflict (doc_id) do update set
+            content = excluded.content,
+            metadata = excluded.metadata,
+            embedding = excluded.embedding
+    """
+    # statement_cache_size=0: Supabase's pooler runs PgBouncer in
+    # transaction mode, which does not support named prepared statements
+    pool = await asyncpg.create_pool(
+        settings.postgres_dsn,
+        min_size=1,
+        max_size=PG_UPSERT_CONCURRENCY,
+        statement_cache_size=0,
+    )
+
+    async def upsert_batch(start: int) -> int:
+        end = start + PG_UPSERT_BATCH_SIZE
+        rows = [
+            (
+                doc.page_content,
+                orjson.dumps(doc.metadata).decode(),
+                _to_pgvector(emb),
+                doc.metadata["doc_id"],
+            )
+            for doc, emb in zip(documents[start:end], embeddings[start:end])
+        ]
+        async with pool.acquire() as conn, conn.transaction():
+            await conn.executemany(sql, rows)
+        return len(rows)
+
+    starts = range(0, len(documents), PG_UPSERT_BATCH_SIZE)
+    try:
+        results = await asyncio.gather(
+            *(upsert_batch(start) for start in starts), return_exceptions=True
+        )
+    finally:
+        await pool.close()
 
-    documents = state["documents"]
-    embeddings = state["embeddings"]
     indexed_count = 0
-    errors = list(state["errors"])
-    batch_size = 50  # smaller batches keep request size manageable
+    errors: List[str] = []
+    for start, result in zip(starts, results):
+        if isinstance(result, Exception):
+            msg = f"[index] Rows {first_row + start}+ failed: {result}"
+            print(msg)
+            errors.append(msg)
+        else:
+            indexed_count += result
+    return indexed_count, errors
+
 
-    for i in range(0, len(documents), batch_size):
-        batch_docs = documents[i : i + batch_size]
-        batch_embs = embeddings[i : i + batch_size]
+def _upsert_rest(
+    settings: Any, documents: List[Document], embeddings: np.ndarray, first_row: int
+) -> Tuple[int, List[str]]:
+    """Upsert chunks through the Supabase REST API. Returns (rows upserted, errors)."""
+    client = _get_supabase_client()
 
+    def upsert_batch(start: int) -> int:
+        end = start + REST_UPSERT_BATCH_SIZE
         rows = [
             {
                 "content": doc.page_content,
                 "metadata": doc.metadata,
-                "embedding": emb,
+                "embedding": _to_pgvector(emb),
                 "doc_id": doc.metadata["doc_id"],
             }
-            for doc, emb in zip(batch_docs, batch_embs)
+            for doc, emb in zip(documents[start:end], embeddings[start:end])
         ]
+        client.table(settings.documents_table).upsert(
+            rows, on_conflict="doc_id"
+        ).execute()
+        return len(rows)
 
-        try:
-            client.table(settings.documents_table).upsert(
-                rows, on_conflict="doc_id"
-            ).execute()
-            indexed_count += len(batch_docs)
+    indexed_count = 0
+    errors: List[str] = []
+    with ThreadPoolExecutor(max_workers=REST_UPSERT_CONCURRENCY) as executor:
+        futures = {
+            executor.submit(upsert_batch, start): start
+            for start in range(0, len(documents), REST_UPSERT_BATCH_SIZE)
+        }
+        for future in as_completed(futures):
+            try:
+                indexed_count += future.result()
+            except Exception as exc:
+                msg = f"[index] Rows {first_row + futures[future]}+ failed: {exc}"
+                print(msg)
+                errors.append(msg)
+    return indexed_count, errors
+
+
+def _upsert_window(
+    settings: Any, documents: List[Document], embeddings: np.ndarray, first_row: int
+) -> Tuple[int, List[str]]:
+    if not settings.postgres_dsn:
+        return _upsert_rest(settings, documents, embeddings, first_row)
+    try:
+        return asyncio.run(_upsert_postgres(settings, documents, embeddings, first_row))
+    except Exception as exc:
+        msg = f"[index] Postgres upsert of rows {first_row}+ failed: {exc}"
+        print(msg)
+        return 0, [msg]
+
+
+def _upload_result(future: Future, first_row: int) -> Tuple[int, List[str]]:
+    """(rows upserted, errors) of a window upload, recording a crash as an error."""
+    try:
+        return future.result()
+    except Exception as exc:
+        msg = f"[index] Upload of rows {first_row}+ failed: {exc}"
+        print(msg)
+        return 0, [msg]
+
+
+def embed_and_index(state: PipelineState) -> Dict[str, Any]:
+    """
+    Embed the chunks and upsert them into Supabase, EMBED_WINDOW_SIZE chunks
+    at a time. Each window is uploaded on a background thread while the
+    next one is encoded, and is dropped once uploaded, so only two windows
+    of embeddings are ever in memory. Uses doc_id as the conflict target so
+    re-runs are idempotent. With POSTGRES_DSN set, rows go straight to
+    Postgres via asyncpg in large pipelined batches; otherwise batches are
+    sent to the REST API concurrently from a small thread pool. Failures
+    are recorded in `errors` rather than raised, so finalize_index still
+    runs and rebuilds an index prepare_index dropped.
+    """
+    settings = state.get("settings") or _get_settings()
+    documents = state["documents"]
+
+    indexed_count = 0
+    errors: List[str] = []
+    with ThreadPoolExecutor(max_workers=1) as uploader:
+        pending = None
+        pending_start = 0
+        for start in range(0, len(documents), EMBED_WINDOW_SIZE):
+            window = documents[start : start + EMBED_WINDOW_SIZE]
+            try:
+                embeddings = _embed(window)
+            except Exception as exc:
+                msg = f"[embed_and_index] Embedding chunks {start}+ failed, stopping: {exc}"
+                print(msg)
+                errors.append(msg)
+                break
+            if pending is not None:
+                upserted, window_errors = _upload_result(pending, pending_start)
+                indexed_count += upserted
+                errors.extend(window_errors)
+            pending = uploader.submit(_upsert_window, settings, window, embeddings, start)
+            pending_start = start
             print(
-                f"[index] Batch {i // batch_size + 1}: "
-                f"upserted {len(batch_docs)} docs (total {indexed_count})"
+                f"[embed_and_index] Embedded {start + len(window)}/{len(documents)} "
+                f"chunks (indexed {indexed_count})"
             )
-        except Exception as exc:
-            msg = f"[index] Batch {i // batch_size + 1} failed: {exc}"
-            print(msg)
-            errors.append(msg)
+        if pending is not None:
+            upserted, window_errors = _upload_result(pending, pending_start)
+            indexed_count += upserted
+            errors.extend(window_errors)
+
+    print(f"[embed_and_index] Total indexed: {indexed_count}")
+    return {"indexed_count": indexed_count, "errors": errors}
+
 
-    print(f"[index_to_supabase] Total indexed: {indexed_count}")
-    return {**state, "indexed_count": indexed_count, "errors": errors}
+# ---------------------------------------------------------------------------
+# Node: prune_stale_chunks
+# ---------------------------------------------------------------------------
+
+
+# URLs per asyncpg delete (one unnest() join)
+PRUNE_PG_BATCH_SIZE = 1000
+
+
+async def _prune_postgres(settings: Any, chunk_counts: Dict[str, int]) -> int:
+    import asyncpg
+
+    urls = list(chunk_counts)
+    conn = await asyncpg.connect(settings.postgres_dsn, statement_cache_size=0)
+    try:
+        deleted = 0
+        for start in range(0, len(urls), PRUNE_PG_BATCH_SIZE):
+            batch = urls[start : start + PRUNE_PG_BATCH_SIZE]
+            status = await conn.execute(
+                f"delete from {settings.documents_table} as d "
+                "using unnest($1::text[], $2::int[]) as s(url, chunk_count) "
+                "where d.metadata @> jsonb_build_object('url', s.url) "
+                "and (d.metadata->>'chunk_index')::int >= s.chunk_count",
+                batch,
+                [chunk_counts[url] for url in batch],
+            )
+            deleted += int(status.split()[-1])
+        return deleted
+    finally:
+        await conn.close()
+
+
+def _prune_rest(settings: Any, chunk_counts: Dict[str, int]) -> int:
+    client = _get_supabase_client()
+
+    def prune(item: Tuple[str, int]) -> int:
+        url, chunk_count = item
+        response = (
+            client.table(settings.documents_table)
+            .delete()
+            .eq("metadata->>url", url)
+            .gte("metadata->chunk_index", chunk_count)
+            .execute()
+        )
+        return len(response.data)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        return sum(executor.map(prune, chunk_counts.items()))
+
+
+def prune_stale_chunks(state: PipelineState) -> Dict[str, Any]:
+    """
+    Delete rows left over from an earlier, longer split of a re-indexed
+    article: chunk indexes at or above its new chunk_count. The upsert only
+    overwrites the doc_ids it writes, so without this a re-chunked article
+    that now yields fewer chunks would keep its old tail. Runs before
+    finalize_index so a rebuilt index does not include them.
+    """
+    settings = state.get("settings") or _get_settings()
+    chunk_counts = {
+        doc.metadata["url"]: doc.metadata["chunk_count"]
+        for doc in state["documents"]
+        if doc.metadata.get("url")
+    }
+    if not chunk_counts:
+        return {}
+    try:
+        if settings.postgres_dsn:
+            deleted = asyncio.run(_prune_postgres(settings, chunk_counts))
+        else:
+            deleted = _prune_rest(settings, chunk_counts)
+    except Exception as exc:
+        msg = f"[prune_stale_chunks] Could not delete stale chunks: {exc}"
+        print(msg)
+        return {"errors": [msg]}
+    print(
+        f"[prune_stale_chunks] Deleted {deleted} stale chunks "
+        f"of {len(chunk_counts)} re-indexed articles"
+    )
+    return {}
 
 
 # ---------------------------------------------------------------------------
@@ -328,18 +1028,26 @@ def build_pipeline():
 
     graph.add_node("fetch_articles", fetch_articles)
     graph.add_node("load_articles", load_articles)
+    graph.add_node("dedupe_articles", dedupe_articles)
     graph.add_node("translate_non_english", translate_non_english)
     graph.add_node("chunk_documents", chunk_documents)
-    graph.add_node("generate_embeddings", generate_embeddings)
-    graph.add_node("index_to_supabase", index_to_supabase)
+    graph.add_node("filter_existing", filter_existing)
+    graph.add_node("prepare_index", prepare_index)
+    graph.add_node("embed_and_index", embed_and_index)
+    graph.add_node("prune_stale_chunks", prune_stale_chunks)
+    graph.add_node("finalize_index", finalize_index)
 
     graph.set_entry_point("fetch_articles")
     graph.add_edge("fetch_articles", "load_articles")
-    graph.add_edge("load_articles", "translate_non_english")
+    graph.add_edge("load_articles", "dedupe_articles")
+    graph.add_edge("dedupe_articles", "translate_non_english")
     graph.add_edge("translate_non_english", "chunk_documents")
-    graph.add_edge("chunk_documents", "generate_embeddings")
-    graph.add_edge("generate_embeddings", "index_to_supabase")
-    graph.add_edge("index_to_supabase", END)
+    graph.add_edge("chunk_documents", "filter_existing")
+    graph.add_edge("filter_existing", "prepare_index")
+    graph.add_edge("prepare_index", "embed_and_index")
+    graph.add_edge("embed_and_index", "prune_stale_chunks")
+    graph.add_edge("prune_stale_chunks", "finalize_index")
+    graph.add_edge("finalize_index", END)
 
     return graph.compile()
 
@@ -356,7 +1064,6 @@ if __name__ == "__main__":
         "raw_articles": [],
         "translated_articles": [],
         "documents": [],
-        "embeddings": [],
         "indexed_count": 0,
         "errors": [],
         "settings": None,
@@ -370,7 +1077,7 @@ if __name__ == "__main__":
     print("Pipeline Summary")
     print("=" * 60)
     print(f"  Articles loaded   : {len(final_state['raw_articles'])}")
-    print(f"  Chunks created    : {len(final_state['documents'])}")
+    print(f"  New chunks        : {len(final_state['documents'])}")
     print(f"  Indexed to Supabase: {final_state['indexed_count']}")
     if final_state["errors"]:
         print(f"  Errors ({len(final_state['errors'])}):")